@@ -32,16 +32,39 @@ IFACE=${IFACE:-enp0s1}
 # DNS base defaults (always included)
 DNS_CSV="${DNS_CSV:-8.8.8.8,1.1.1.1}"
 
+# NO_PARALLEL=1 provisions VMs one at a time
+NO_PARALLEL=${NO_PARALLEL:-0}
+
+# LEGACY_ISO=1 builds seed ISOs with hdiutil even if xorrisofs/mkisofs exist
+LEGACY_ISO=${LEGACY_ISO:-0}
+
+# SAFE_CREATE=1 runs qemu-img for every overlay instead of copying one blank overlay
+SAFE_CREATE=${SAFE_CREATE:-0}
+
 # Derived dirs
 OVERLAYS_DIR="${ROOT_DIR}/overlays"
 SEEDS_DIR="${ROOT_DIR}/seeds"
 mkdir -p "$OVERLAYS_DIR" "$SEEDS_DIR"
 
+# Scratch dir for the cloud-init files packed into each seed ISO; only the
+# ISOs themselves are kept under seeds/
+STAGING_DIR="$(mktemp -d "${TMPDIR:-/tmp}/ae3gis-seed.XXXXXX")"
+# Blank overlay that new per-VM overlays are copied from (see below); set only
+# if this run created one, so the trap never touches another run's template
+OVERLAY_TEMPLATE=""
+trap 'rm -rf "$STAGING_DIR"; [[ -z "$OVERLAY_TEMPLATE" ]] || rm -f "$OVERLAY_TEMPLATE"' EXIT
+
 ### =======================
 ### helpers
 ### =======================
-ip2int(){ local IFS=.; read -r a b c d <<<"$1"; echo $(( (a<<24)+(b<<16)+(c<<8)+d )); }
-int2ip(){ printf "%d.%d.%d.%d" $(( ($1>>24)&255 )) $(( ($1>>16)&255 )) $(( ($1>>8)&255 )) $(( $1&255 )); }
+# ip2int A.B.C.D VAR — stores the 32-bit value in VAR (no subshell or here-string)
+ip2int(){ local IFS=. var="$2"; set -- $1; printf -v "$var" "%d" $(( ($1<<24)+($2<<16)+($3<<8)+$4 )); }
+# int2ip INT VAR — stores the dotted quad in VAR (no subshell)
+int2ip(){ printf -v "$2" "%d.%d.%d.%d" $(( ($1>>24)&255 )) $(( ($1>>16)&255 )) $(( ($1>>8)&255 )) $(( $1&255 )); }
+# gen_mac I VAR — stores VM I's MAC in VAR, derived from I alone (no shared state).
+# Same 52:54:00:12:34:<50+I> addresses as before, carrying into the fifth octet
+# past I=205 instead of producing an invalid three-digit octet.
+gen_mac(){ local n=$((0x3432 + $1)); printf -v "$2" "52:54:00:12:%02x:%02x" $(( (n>>8)&255 )) $(( n&255 )); }
 have(){ command -v "$1" >/dev/null 2>&1; }
 die(){ echo "[-] $*" >&2; exit 1; }
 
@@ -49,18 +72,70 @@ die(){ echo "[-] $*" >&2; exit 1; }
 detect_host_gateway() {
   if have route; then
     local gw
-    gw=$(route -n get default 2>/dev/null | awk '/gateway:/{print $2}' | head -n1 || true)
+    gw=$(route -n get default 2>/dev/null | awk '/gateway:/{print $2; exit}' || true)
     [[ -n "$gw" ]] && echo "$gw" && return 0
   fi
   # Fallback (only if detection fails): keep empty to avoid bad assumptions
   echo ""
 }
 
+# Pick the seed ISO builder (once per run). xorrisofs/mkisofs write the image in
+# one quick pass; hdiutil makehybrid is much slower to start, so it is only used
+# when neither is installed or LEGACY_ISO=1.
+detect_iso_tool() {
+  if [[ "$LEGACY_ISO" != 1 ]] && have xorrisofs; then
+    echo "xorrisofs"
+  elif [[ "$LEGACY_ISO" != 1 ]] && have mkisofs; then
+    echo "mkisofs"
+  elif have hdiutil; then
+    echo "hdiutil"
+  else
+    echo ""
+  fi
+}
+
+# Pack a cloud-init dir into a cidata ISO with $ISO_TOOL: build_seed_iso SEED_INIT SEED_ISO
+build_seed_iso() {
+  local src="$1" out="$2"
+  case "$ISO_TOOL" in
+    xorrisofs)
+      xorrisofs -quiet -o "$out" -V cidata -J -R "$src" >/dev/null
+      ;;
+    mkisofs)
+      mkisofs -quiet -output "$out" -volid cidata -joliet -rock "$src" >/dev/null
+      ;;
+    hdiutil)
+      # hdiutil appends .iso to the -o name itself
+      OBJC_DISABLE_INITIALIZE_FORK_SAFETY=YES \
+      hdiutil makehybrid -quiet -iso -joliet -default-volume-name cidata -o "${out%.iso}" "$src" >/dev/null
+      ;;
+  esac
+}
+
 ### checks
 [[ -f "$BASE_QCOW2" ]] || die "Base qcow2 not found: $BASE_QCOW2"
 [[ -f "$VARS_FD"   ]]  || die "vars.fd not found: $VARS_FD"
 [[ -f "$BIOS_FD"   ]]  || die "BIOS fd not found: $BIOS_FD"
 
+# instances.csv rows and QEMU's -drive/-nic options are plain comma-joined
+# strings, so names and paths must not contain commas or quotes
+for v in "$NAME_PREFIX" "$OVERLAYS_DIR" "$SEEDS_DIR"; do
+  [[ "$v" != *[,\"]* ]] || die "Commas and quotes are not supported in VM names or paths: $v"
+done
+
+ISO_TOOL="$(detect_iso_tool)"
+[[ -n "$ISO_TOOL" ]] || die "No ISO builder found (need xorrisofs, mkisofs or hdiutil)."
+
+# Gateway: use provided param; else auto-detect from host default route
+# (looked up once here and shared by every VM)
+GW="$GATEWAY_PARAM"
+if [[ -z "$GW" ]]; then
+  GW="$(detect_host_gateway)"
+  if [[ -z "$GW" ]]; then
+    echo "[!] Could not auto-detect gateway; leaving empty. Your bootcmd will still write file but netplan may need a valid gateway."
+  fi
+fi
+
 echo "[*] Spawning ${COUNT} VM(s) starting at ${START_IP} (${NAME_PREFIX}-1..${NAME_PREFIX}-${COUNT})"
 echo "    Bridge: ${BRIDGE} | Base: ${BASE_QCOW2} | RAM: ${MEM_MB} | vCPU: ${SMP} | Iface: ${IFACE}"
 
@@ -72,58 +147,17 @@ sudo -v
 TERM_APP="${TERM_APP:-terminal}"
 TERM_APP_LOWER="$(echo "$TERM_APP" | tr '[:upper:]' '[:lower:]')"
 
-# IP math init
-ip_int=$(ip2int "$START_IP")
-SUMMARY=()
-
-for i in $(seq 1 "$COUNT"); do
-  NAME="${NAME_PREFIX}-${i}"
-  IP=$(int2ip "$ip_int")
-  ip_int=$((ip_int+1))
-
-  OVL="${OVERLAYS_DIR}/overlay-${i}.qcow2"
-  VM_VARS="${OVERLAYS_DIR}/${NAME}-vars.fd"
-  SEED_INIT="${SEEDS_DIR}/seed-init-${i}"
-  SEED_ISO="${SEEDS_DIR}/seed-${i}.iso"
-
-  # Gateway: use provided param; else auto-detect from host default route
-  GW="$GATEWAY_PARAM"
-  if [[ -z "$GW" ]]; then
-    GW="$(detect_host_gateway)"
-    if [[ -z "$GW" ]]; then
-      echo "[!] Could not auto-detect gateway; leaving empty. Your bootcmd will still write file but netplan may need a valid gateway."
-    fi
-  fi
-
-  # DNS: defaults + optional extras
-  DNS_COMBINED="$DNS_CSV"
-  if [[ -n "$EXTRA_DNS_CSV" ]]; then
-    DNS_COMBINED="${DNS_COMBINED},${EXTRA_DNS_CSV}"
-  fi
-  DNS_LIST="${DNS_COMBINED//,/,\ }"   # pretty spacing in YAML
-
-  mkdir -p "$SEED_INIT"
-
-  # 1) overlay disk
-  if [[ ! -f "$OVL" ]]; then
-    echo "[*] Creating overlay: $OVL"
-    qemu-img create -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVL" >/dev/null
-  else
-    echo "[=] Overlay exists, skipping: $OVL"
-  fi
-
-  # 1b) per-VM vars.fd (UEFI variables must be unique per VM)
-  if [[ ! -f "$VM_VARS" ]]; then
-    echo "[*] Creating VM-specific vars.fd: $VM_VARS"
-    cp "$VARS_FD" "$VM_VARS"
-  else
-    echo "[=] VM vars.fd exists, skipping: $VM_VARS"
-  fi
-
-  # 2) cloud-init files (your original content with variable substitution)
-
-  # network-config (kept minimal—your original uses bootcmd for netplan)
-  cat >"${SEED_INIT}/network-config" <<EOF
+### =======================
+### cloud-init templates
+### =======================
+# Defined once up front; provision_vm only fills in the per-VM values.
+# Templates expand through the read builtin, so rendering forks nothing.
+
+# network-config (kept minimal—your original uses bootcmd for netplan)
+# usage: render_network_config IP GW
+render_network_config() {
+  local IP="$1" GW="$2" out
+  IFS= read -r -d '' out <<EOF || true
 version: 2
 ethernets:
     ${IFACE}:
@@ -136,32 +170,24 @@ ethernets:
                 - ${GW}
                 - 8.8.8.8
 EOF
+  printf '%s' "$out"
+}
 
-  # meta-data
-  cat >"${SEED_INIT}/meta-data" <<EOF
+# meta-data — usage: render_meta_data NAME
+render_meta_data() {
+  local NAME="$1" out
+  IFS= read -r -d '' out <<EOF || true
 instance-id: ${NAME}
 local-hostname: ${NAME}
 EOF
+  printf '%s' "$out"
+}
 
-  # 99-disable-network-config.cfg
-  cat >"${SEED_INIT}/99-disable-network-config.cfg" <<'EOF'
-# Prevent cloud-init from managing network if we've already set netplan
-network:
-  config: disabled
-EOF
-
-  # 99-cloud-config.cfg (placeholder for extras if you want later)
-  cat >"${SEED_INIT}/99-cloud-config.cfg" <<'EOF'
-# Extra cloud-init config (placeholder)
-cloud_final_modules:
- - [scripts-per-once, always]
-
-network:
-  config: disabled
-EOF
-
-  # user-data — EXACT structure from your original, with IP/GW/DNS/IFACE injected
-  cat >"${SEED_INIT}/user-data" <<EOF
+# user-data — EXACT structure from your original, with IP/GW/DNS/IFACE injected
+# usage: render_user_data IP GW
+render_user_data() {
+  local IP="$1" GW="$2" out
+  IFS= read -r -d '' out <<EOF || true
 ssh_pwauth: true
 
 users:
@@ -245,23 +271,172 @@ runcmd:
   - 'ufw allow 3080/tcp || true'
   - 'yes | ufw enable || true'
 EOF
+  printf '%s' "$out"
+}
+
+# 99-disable-network-config.cfg
+IFS= read -r -d '' DISABLE_NET_CFG <<'EOF' || true
+# Prevent cloud-init from managing network if we've already set netplan
+network:
+  config: disabled
+EOF
+
+# 99-cloud-config.cfg (placeholder for extras if you want later)
+IFS= read -r -d '' CLOUD_CFG_EXTRA <<'EOF' || true
+# Extra cloud-init config (placeholder)
+cloud_final_modules:
+ - [scripts-per-once, always]
+
+network:
+  config: disabled
+EOF
+
+### =======================
+### per-VM provisioning
+### =======================
+
+# Per-VM names and paths for VM number $1
+vm_paths() {
+  NAME="${NAME_PREFIX}-${1}"
+  OVL="${OVERLAYS_DIR}/overlay-${1}.qcow2"
+  VM_VARS="${OVERLAYS_DIR}/${NAME}-vars.fd"
+  SEED_INIT="${STAGING_DIR}/seed-init-${1}"
+  SEED_ISO="${SEEDS_DIR}/seed-${1}.iso"
+}
+
+# Overlay disk, vars.fd, cloud-init files and seed ISO for VM $1 with IP $2.
+# Runs in a background subshell, so it must only touch its own VM's files.
+provision_vm() {
+  local i="$1" IP="$2"
+  vm_paths "$i"
+
+  mkdir -p "$SEED_INIT"
+
+  # 1) overlay disk (in the background; the seed ISO below does not depend on it)
+  local ovl_pid=""
+  if [[ ! -f "$OVL" ]]; then
+    echo "[*] Creating overlay: $OVL"
+    if [[ -n "$OVERLAY_TEMPLATE" ]]; then
+      cp "$OVERLAY_TEMPLATE" "$OVL"
+    else
+      qemu-img create -q -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVL" >/dev/null &
+      ovl_pid=$!
+    fi
+  else
+    echo "[=] Overlay exists, skipping: $OVL"
+  fi
 
-  # 3) build seed ISO (macOS-safe; fallback to mkisofs/xorrisofs if available)
+  # 1b) per-VM vars.fd (UEFI variables must be unique per VM)
+  if [[ ! -f "$VM_VARS" ]]; then
+    echo "[*] Creating VM-specific vars.fd: $VM_VARS"
+    cp "$VARS_FD" "$VM_VARS"
+  else
+    echo "[=] VM vars.fd exists, skipping: $VM_VARS"
+  fi
+
+  # 2) cloud-init files (your original content with variable substitution)
+  render_network_config "$IP" "$GW" >"${SEED_INIT}/network-config"
+  render_meta_data "$NAME" >"${SEED_INIT}/meta-data"
+  printf '%s' "$DISABLE_NET_CFG" >"${SEED_INIT}/99-disable-network-config.cfg"
+  printf '%s' "$CLOUD_CFG_EXTRA" >"${SEED_INIT}/99-cloud-config.cfg"
+  render_user_data "$IP" "$GW" >"${SEED_INIT}/user-data"
+
+  # 3) build seed ISO
   echo "[*] Building seed ISO: ${SEED_ISO}"
-  ISO_TMP="${SEED_ISO%.iso}"
-  if have hdiutil; then
-    OBJC_DISABLE_INITIALIZE_FORK_SAFETY=YES \
-    hdiutil makehybrid -iso -joliet -default-volume-name cidata -o "$ISO_TMP" "$SEED_INIT" >/dev/null
-    mv -f "${ISO_TMP}.iso" "$SEED_ISO"
-  elif have mkisofs; then
-    mkisofs -output "$SEED_ISO" -volid cidata -joliet -rock "$SEED_INIT" >/dev/null
-  elif have xorrisofs; then
-    xorrisofs -o "$SEED_ISO" -V cidata -J -R "$SEED_INIT" >/dev/null
+  build_seed_iso "$SEED_INIT" "$SEED_ISO"
+  rm -rf "$SEED_INIT"
+
+  # wait for the overlay disk from step 1
+  if [[ -n "$ovl_pid" ]]; then
+    wait "$ovl_pid" || die "qemu-img failed to create overlay: $OVL"
+  fi
+}
+
+# A new overlay only records its backing file, so every VM's blank overlay is
+# byte-identical: run qemu-img once and copy the result for each new VM.
+if [[ "$SAFE_CREATE" != 1 ]]; then
+  for ((i = 1; i <= COUNT; i++)); do
+    vm_paths "$i"
+    if [[ ! -f "$OVL" ]]; then
+      # unique name in overlays/ (so relative backing paths resolve the same way)
+      OVERLAY_TEMPLATE="$(mktemp "${OVERLAYS_DIR}/.overlay-template.XXXXXX")"
+      # mktemp makes it 0600 and cp keeps that; match what qemu-img would create
+      chmod 0644 "$OVERLAY_TEMPLATE"
+      qemu-img create -q -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVERLAY_TEMPLATE" >/dev/null
+      break
+    fi
+  done
+fi
+
+# IP math init (every VM gets its IP up front, so workers share no counter)
+ip2int "$START_IP" ip_int
+IPS=()
+for ((i = 1; i <= COUNT; i++)); do
+  int2ip $((ip_int + i - 1)) IP
+  IPS+=("$IP")
+done
+
+# provision all VMs concurrently; each one is independent disk/ISO work
+PIDS=()
+for ((i = 1; i <= COUNT; i++)); do
+  if [[ "$NO_PARALLEL" == 1 ]]; then
+    provision_vm "$i" "${IPS[i-1]}"
   else
-    die "No ISO builder found (need hdiutil or mkisofs or xorrisofs)."
+    provision_vm "$i" "${IPS[i-1]}" &
+    PIDS[i]=$!
+  fi
+done
+
+# Output from the workers is interleaved, so name each VM that failed
+FAILED=0
+for ((i = 1; i <= COUNT; i++)); do
+  [[ -n "${PIDS[i]:-}" ]] || continue
+  if ! wait "${PIDS[i]}"; then
+    echo "[-] Provisioning failed for ${NAME_PREFIX}-${i}" >&2
+    FAILED=1
   fi
-  
-  MAC_SUFFIX=$(printf "%02x" $((50 + i)))
+done
+[[ "$FAILED" == 0 ]] || die "Provisioning failed for one or more VMs; nothing launched."
+
+SUMMARY=()
+
+# instances.csv gets one row per VM as soon as it is launched, so a run that
+# dies part-way still records the VMs that did come up. The file is kept across
+# runs: a VM's old row (NAME_PREFIX-1..COUNT) stays until its new one replaces
+# it, and rows for any other VM are left alone.
+INSTANCES_CSV="${ROOT_DIR}/instances.csv"
+CSV_OTHER_ROWS="NAME,IP,MAC,DISK,SEED_ISO"$'\n'
+CSV_VM_ROWS=()
+if [[ -s "$INSTANCES_CSV" ]]; then
+  CSV_OTHER_ROWS=""
+  while IFS= read -r row || [[ -n "$row" ]]; do
+    n="${row%%,*}"
+    n="${n#"${NAME_PREFIX}-"}"
+    if [[ "$row" == "${NAME_PREFIX}-"*,* && -n "$n" && "$n" != *[!0-9]* ]] && (( 10#$n >= 1 && 10#$n <= COUNT )); then
+      CSV_VM_ROWS[10#$n]="$row"
+      continue
+    fi
+    CSV_OTHER_ROWS+="${row}"$'\n'
+  done <"$INSTANCES_CSV"
+fi
+
+# Rewrite instances.csv in one write: other VMs' rows, then this run's VMs in order
+write_instances_csv() {
+  local rows="$CSV_OTHER_ROWS" j
+  for ((j = 1; j <= COUNT; j++)); do
+    if [[ -n "${CSV_VM_ROWS[j]:-}" ]]; then
+      rows+="${CSV_VM_ROWS[j]}"$'\n'
+    fi
+  done
+  printf '%s' "$rows" >"$INSTANCES_CSV"
+}
+write_instances_csv
+
+for ((i = 1; i <= COUNT; i++)); do
+  vm_paths "$i"
+  IP="${IPS[i-1]}"
+
+  gen_mac "$i" MAC
   UNIQUE_UUID=$(uuidgen)
   # 4) open a new Terminal/iTerm window and run QEMU in foreground
   QEMU_CMD="sudo qemu-system-aarch64 \
@@ -271,13 +446,13 @@ EOF
     -drive if=pflash,format=raw,unit=1,file=${VM_VARS} \
     -drive if=virtio,file=${OVL},format=qcow2,cache=none,discard=unmap \
     -drive if=virtio,file=${SEED_ISO},format=raw,readonly=on \
-    -nic vmnet-bridged,ifname=${BRIDGE},model=virtio-net-pci,mac=52:54:00:12:34:${MAC_SUFFIX} \
+    -nic vmnet-bridged,ifname=${BRIDGE},model=virtio-net-pci,mac=${MAC} \
     -uuid ${UNIQUE_UUID} \
     -name ${NAME} \
     -nographic"
     
-    # -nic user,model=virtio-net-pci,dhcpstart=10.0.2.100,mac=52:54:00:12:34:${MAC_SUFFIX} \
-    # -nic vmnet-host,model=virtio-net-pci,mac=52:54:00:12:34:${MAC_SUFFIX} \
+    # -nic user,model=virtio-net-pci,dhcpstart=10.0.2.100,mac=${MAC} \
+    # -nic vmnet-host,model=virtio-net-pci,mac=${MAC} \
 
   if [[ "$TERM_APP_LOWER" == "iterm" ]]; then
     osascript <<OSA
@@ -296,15 +471,18 @@ OSA
   fi
 
   echo "[+] Launched ${NAME} (IP ${IP}) in a new ${TERM_APP_LOWER} window"
-  SUMMARY+=("${NAME} ${IP}")
+  CSV_VM_ROWS[i]="${NAME},${IP},${MAC},${OVL},${SEED_ISO}"
+  write_instances_csv
+  SUMMARY+=("$NAME" "$IP")
 done
 
 echo
 echo "Summary"
 echo "-------"
-for line in "${SUMMARY[@]}"; do
-  printf "%-16s %s\n" "${line%% *}" "${line##* }"
-done
+if (( COUNT > 0 )); then
+  printf "%-16s %s\n" ${SUMMARY[@]+"${SUMMARY[@]}"}
+fi
+echo "(also written to ${INSTANCES_CSV})"
 
 echo
 echo "Tip: check each VM's cloud-init progress with:  sudo tail -f /var/log/cloud-init-output.log"
@@ -45,28 +45,74 @@ IFACE=${IFACE:-enp0s1}
 # DNS defaults
 DNS_CSV="${DNS_CSV:-8.8.8.8,1.1.1.1}"
 
+# Set NO_PARALLEL=1 to provision VMs one at a time
+NO_PARALLEL=${NO_PARALLEL:-0}
+
+# Set SAFE_CREATE=1 to run qemu-img for every overlay instead of copying one blank overlay
+SAFE_CREATE=${SAFE_CREATE:-0}
+
 # Derived dirs
 OVERLAYS_DIR="${ROOT_DIR}/overlays"
 SEEDS_DIR="${ROOT_DIR}/seeds"
 mkdir -p "$OVERLAYS_DIR" "$SEEDS_DIR"
 
+# Scratch dir for the cloud-init files packed into each seed ISO; only the
+# ISOs themselves are kept under seeds/
+STAGING_DIR="$(mktemp -d "${TMPDIR:-/tmp}/ae3gis-seed.XXXXXX")"
+# Blank overlay that new per-VM overlays are copied from (see below); set only
+# if this run created one, so the trap never touches another run's template
+OVERLAY_TEMPLATE=""
+trap 'rm -rf "$STAGING_DIR"; [[ -z "$OVERLAY_TEMPLATE" ]] || rm -f "$OVERLAY_TEMPLATE"' EXIT
+
 ### =======================
 ### Helpers
 ### =======================
-ip2int(){ local IFS=.; read -r a b c d <<<"$1"; echo $(( (a<<24)+(b<<16)+(c<<8)+d )); }
-int2ip(){ printf "%d.%d.%d.%d" $(( ($1>>24)&255 )) $(( ($1>>16)&255 )) $(( ($1>>8)&255 )) $(( $1&255 )); }
+# ip2int A.B.C.D VAR — stores the 32-bit value in VAR (no subshell or here-string)
+ip2int(){ local IFS=. var="$2"; set -- $1; printf -v "$var" "%d" $(( ($1<<24)+($2<<16)+($3<<8)+$4 )); }
+# int2ip INT VAR — stores the dotted quad in VAR (no subshell)
+int2ip(){ printf -v "$2" "%d.%d.%d.%d" $(( ($1>>24)&255 )) $(( ($1>>16)&255 )) $(( ($1>>8)&255 )) $(( $1&255 )); }
+# gen_mac I VAR — stores VM I's MAC in VAR, derived from I alone (no shared state).
+# Same 52:54:00:12:34:<50+I> addresses as before, carrying into the fifth octet
+# past I=205 instead of producing an invalid three-digit octet.
+gen_mac(){ local n=$((0x3432 + $1)); printf -v "$2" "52:54:00:12:%02x:%02x" $(( (n>>8)&255 )) $(( n&255 )); }
 have(){ command -v "$1" >/dev/null 2>&1; }
 die(){ echo "[-] $*" >&2; exit 1; }
 
 detect_host_gateway() {
   if have ip; then
     local gw
-    gw=$(ip route show default 2>/dev/null | awk '/default/{print $3}' | head -n1 || true)
+    gw=$(ip route show default 2>/dev/null | awk '/default/{print $3; exit}' || true)
     [[ -n "$gw" ]] && echo "$gw" && return 0
   fi
   echo ""
 }
 
+# Detect seed ISO builder
+detect_iso_tool() {
+  if have genisoimage; then
+    echo "genisoimage"
+  elif have mkisofs; then
+    echo "mkisofs"
+  elif have xorrisofs; then
+    echo "xorrisofs"
+  else
+    echo ""
+  fi
+}
+
+# Pack a cloud-init dir into a cidata ISO with $ISO_TOOL: build_seed_iso SEED_INIT SEED_ISO
+build_seed_iso() {
+  local src="$1" out="$2"
+  case "$ISO_TOOL" in
+    genisoimage|mkisofs)
+      "$ISO_TOOL" -quiet -output "$out" -volid cidata -joliet -rock "$src" 2>/dev/null
+      ;;
+    xorrisofs)
+      xorrisofs -quiet -o "$out" -V cidata -J -R "$src" 2>/dev/null
+      ;;
+  esac
+}
+
 # Detect terminal emulator
 detect_terminal() {
   if have gnome-terminal; then
@@ -87,9 +133,27 @@ detect_terminal() {
 [[ -f "$VARS_FD"   ]] || die "vars.fd not found: $VARS_FD"
 [[ -n "$BIOS_FD" && -f "$BIOS_FD" ]] || die "UEFI firmware not found. Set BIOS_FD=/path/to/QEMU_EFI.fd"
 
+# instances.csv rows and QEMU's -drive/-nic options are plain comma-joined
+# strings, so names and paths must not contain commas or quotes
+for v in "$NAME_PREFIX" "$OVERLAYS_DIR" "$SEEDS_DIR"; do
+  [[ "$v" != *[,\"]* ]] || die "Commas and quotes are not supported in VM names or paths: $v"
+done
+
 TERM_EMU="${TERM_EMU:-$(detect_terminal)}"
 [[ -n "$TERM_EMU" ]] || die "No terminal emulator found. Install gnome-terminal, konsole, or xterm."
 
+ISO_TOOL="$(detect_iso_tool)"
+[[ -n "$ISO_TOOL" ]] || die "No ISO builder found (need genisoimage, mkisofs, or xorrisofs)."
+
+# Gateway (looked up once and shared by every VM)
+GW="$GATEWAY_PARAM"
+if [[ -z "$GW" ]]; then
+  GW="$(detect_host_gateway)"
+  if [[ -z "$GW" ]]; then
+    echo "[!] Could not auto-detect gateway"
+  fi
+fi
+
 echo "[*] Spawning ${COUNT} VM(s) starting at ${START_IP} (${NAME_PREFIX}-1..${NAME_PREFIX}-${COUNT})"
 echo "    Bridge: ${BRIDGE} | Base: ${BASE_QCOW2} | RAM: ${MEM_MB} | vCPU: ${SMP}"
 echo "    Terminal: ${TERM_EMU} | BIOS: ${BIOS_FD}"
@@ -98,55 +162,16 @@ echo "    Terminal: ${TERM_EMU} | BIOS: ${BIOS_FD}"
 echo "[*] Warming up sudo..."
 sudo -v
 
-# IP math init
-ip_int=$(ip2int "$START_IP")
-SUMMARY=()
-
-for i in $(seq 1 "$COUNT"); do
-  NAME="${NAME_PREFIX}-${i}"
-  IP=$(int2ip "$ip_int")
-  ip_int=$((ip_int+1))
-
-  OVL="${OVERLAYS_DIR}/overlay-${i}.qcow2"
-  VM_VARS="${OVERLAYS_DIR}/${NAME}-vars.fd"
-  SEED_INIT="${SEEDS_DIR}/seed-init-${i}"
-  SEED_ISO="${SEEDS_DIR}/seed-${i}.iso"
-
-  # Gateway
-  GW="$GATEWAY_PARAM"
-  if [[ -z "$GW" ]]; then
-    GW="$(detect_host_gateway)"
-    if [[ -z "$GW" ]]; then
-      echo "[!] Could not auto-detect gateway"
-    fi
-  fi
-
-  # DNS
-  DNS_COMBINED="$DNS_CSV"
-  if [[ -n "$EXTRA_DNS_CSV" ]]; then
-    DNS_COMBINED="${DNS_COMBINED},${EXTRA_DNS_CSV}"
-  fi
-
-  mkdir -p "$SEED_INIT"
-
-  # 1) Overlay disk
-  if [[ ! -f "$OVL" ]]; then
-    echo "[*] Creating overlay: $OVL"
-    qemu-img create -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVL" >/dev/null
-  else
-    echo "[=] Overlay exists, skipping: $OVL"
-  fi
-
-  # 1b) Per-VM vars.fd
-  if [[ ! -f "$VM_VARS" ]]; then
-    echo "[*] Creating VM-specific vars.fd: $VM_VARS"
-    cp "$VARS_FD" "$VM_VARS"
-  else
-    echo "[=] VM vars.fd exists, skipping: $VM_VARS"
-  fi
+### =======================
+### Cloud-init templates
+### =======================
+# Defined once up front; provision_vm only fills in the per-VM values.
+# Templates expand through the read builtin, so rendering forks nothing.
 
-  # 2) Cloud-init files
-  cat >"${SEED_INIT}/network-config" <<EOF
+# usage: render_network_config IP GW
+render_network_config() {
+  local IP="$1" GW="$2" out
+  IFS= read -r -d '' out <<EOF || true
 version: 2
 ethernets:
     ${IFACE}:
@@ -159,26 +184,23 @@ ethernets:
                 - ${GW}
                 - 8.8.8.8
 EOF
+  printf '%s' "$out"
+}
 
-  cat >"${SEED_INIT}/meta-data" <<EOF
+# usage: render_meta_data NAME
+render_meta_data() {
+  local NAME="$1" out
+  IFS= read -r -d '' out <<EOF || true
 instance-id: ${NAME}
 local-hostname: ${NAME}
 EOF
+  printf '%s' "$out"
+}
 
-  cat >"${SEED_INIT}/99-disable-network-config.cfg" <<'EOF'
-network:
-  config: disabled
-EOF
-
-  cat >"${SEED_INIT}/99-cloud-config.cfg" <<'EOF'
-cloud_final_modules:
- - [scripts-per-once, always]
-
-network:
-  config: disabled
-EOF
-
-  cat >"${SEED_INIT}/user-data" <<EOF
+# usage: render_user_data IP GW
+render_user_data() {
+  local IP="$1" GW="$2" out
+  IFS= read -r -d '' out <<EOF || true
 ssh_pwauth: true
 
 users:
@@ -246,20 +268,170 @@ runcmd:
   - 'ufw allow 3080/tcp || true'
   - 'yes | ufw enable || true'
 EOF
+  printf '%s' "$out"
+}
+
+# 99-disable-network-config.cfg (same for every VM)
+IFS= read -r -d '' DISABLE_NET_CFG <<'EOF' || true
+network:
+  config: disabled
+EOF
+
+# 99-cloud-config.cfg (same for every VM)
+IFS= read -r -d '' CLOUD_CFG_EXTRA <<'EOF' || true
+cloud_final_modules:
+ - [scripts-per-once, always]
+
+network:
+  config: disabled
+EOF
+
+### =======================
+### Per-VM provisioning
+### =======================
+
+# Per-VM names and paths for VM number $1
+vm_paths() {
+  NAME="${NAME_PREFIX}-${1}"
+  OVL="${OVERLAYS_DIR}/overlay-${1}.qcow2"
+  VM_VARS="${OVERLAYS_DIR}/${NAME}-vars.fd"
+  SEED_INIT="${STAGING_DIR}/seed-init-${1}"
+  SEED_ISO="${SEEDS_DIR}/seed-${1}.iso"
+}
+
+# Overlay disk, vars.fd, cloud-init files and seed ISO for VM $1 with IP $2.
+# Runs in a background subshell, so it must only touch its own VM's files.
+provision_vm() {
+  local i="$1" IP="$2"
+  vm_paths "$i"
+
+  mkdir -p "$SEED_INIT"
+
+  # 1) Overlay disk (in the background; the seed ISO below does not depend on it)
+  local ovl_pid=""
+  if [[ ! -f "$OVL" ]]; then
+    echo "[*] Creating overlay: $OVL"
+    if [[ -n "$OVERLAY_TEMPLATE" ]]; then
+      cp "$OVERLAY_TEMPLATE" "$OVL"
+    else
+      qemu-img create -q -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVL" >/dev/null &
+      ovl_pid=$!
+    fi
+  else
+    echo "[=] Overlay exists, skipping: $OVL"
+  fi
+
+  # 1b) Per-VM vars.fd
+  if [[ ! -f "$VM_VARS" ]]; then
+    echo "[*] Creating VM-specific vars.fd: $VM_VARS"
+    cp "$VARS_FD" "$VM_VARS"
+  else
+    echo "[=] VM vars.fd exists, skipping: $VM_VARS"
+  fi
+
+  # 2) Cloud-init files
+  render_network_config "$IP" "$GW" >"${SEED_INIT}/network-config"
+  render_meta_data "$NAME" >"${SEED_INIT}/meta-data"
+  printf '%s' "$DISABLE_NET_CFG" >"${SEED_INIT}/99-disable-network-config.cfg"
+  printf '%s' "$CLOUD_CFG_EXTRA" >"${SEED_INIT}/99-cloud-config.cfg"
+  render_user_data "$IP" "$GW" >"${SEED_INIT}/user-data"
 
   # 3) Build seed ISO
   echo "[*] Building seed ISO: ${SEED_ISO}"
-  if have genisoimage; then
-    genisoimage -output "$SEED_ISO" -volid cidata -joliet -rock "$SEED_INIT" 2>/dev/null
-  elif have mkisofs; then
-    mkisofs -output "$SEED_ISO" -volid cidata -joliet -rock "$SEED_INIT" 2>/dev/null
-  elif have xorrisofs; then
-    xorrisofs -o "$SEED_ISO" -V cidata -J -R "$SEED_INIT" 2>/dev/null
+  build_seed_iso "$SEED_INIT" "$SEED_ISO"
+  rm -rf "$SEED_INIT"
+
+  # Wait for the overlay disk from step 1
+  if [[ -n "$ovl_pid" ]]; then
+    wait "$ovl_pid" || die "qemu-img failed to create overlay: $OVL"
+  fi
+}
+
+# A new overlay only records its backing file, so every VM's blank overlay is
+# byte-identical: run qemu-img once and copy the result for each new VM.
+if [[ "$SAFE_CREATE" != 1 ]]; then
+  for ((i = 1; i <= COUNT; i++)); do
+    vm_paths "$i"
+    if [[ ! -f "$OVL" ]]; then
+      # unique name in overlays/ (so relative backing paths resolve the same way)
+      OVERLAY_TEMPLATE="$(mktemp "${OVERLAYS_DIR}/.overlay-template.XXXXXX")"
+      # mktemp makes it 0600 and cp keeps that; match what qemu-img would create
+      chmod 0644 "$OVERLAY_TEMPLATE"
+      qemu-img create -q -f qcow2 -F qcow2 -b "$BASE_QCOW2" "$OVERLAY_TEMPLATE" >/dev/null
+      break
+    fi
+  done
+fi
+
+# IP math init (every VM gets its IP up front, so workers share no counter)
+ip2int "$START_IP" ip_int
+IPS=()
+for ((i = 1; i <= COUNT; i++)); do
+  int2ip $((ip_int + i - 1)) IP
+  IPS+=("$IP")
+done
+
+# Provision all VMs concurrently; each one is independent disk/ISO work
+PIDS=()
+for ((i = 1; i <= COUNT; i++)); do
+  if [[ "$NO_PARALLEL" == 1 ]]; then
+    provision_vm "$i" "${IPS[i-1]}"
   else
-    die "No ISO builder found (need genisoimage, mkisofs, or xorrisofs)."
+    provision_vm "$i" "${IPS[i-1]}" &
+    PIDS[i]=$!
+  fi
+done
+
+# Output from the workers is interleaved, so name each VM that failed
+FAILED=0
+for ((i = 1; i <= COUNT; i++)); do
+  [[ -n "${PIDS[i]:-}" ]] || continue
+  if ! wait "${PIDS[i]}"; then
+    echo "[-] Provisioning failed for ${NAME_PREFIX}-${i}" >&2
+    FAILED=1
   fi
+done
+[[ "$FAILED" == 0 ]] || die "Provisioning failed for one or more VMs; nothing launched."
+
+SUMMARY=()
 
-  MAC_SUFFIX=$(printf "%02x" $((50 + i)))
+# instances.csv gets one row per VM as soon as it is launched, so a run that
+# dies part-way still records the VMs that did come up. The file is kept across
+# runs: a VM's old row (NAME_PREFIX-1..COUNT) stays until its new one replaces
+# it, and rows for any other VM are left alone.
+INSTANCES_CSV="${ROOT_DIR}/instances.csv"
+CSV_OTHER_ROWS="NAME,IP,MAC,DISK,SEED_ISO"$'\n'
+CSV_VM_ROWS=()
+if [[ -s "$INSTANCES_CSV" ]]; then
+  CSV_OTHER_ROWS=""
+  while IFS= read -r row || [[ -n "$row" ]]; do
+    n="${row%%,*}"
+    n="${n#"${NAME_PREFIX}-"}"
+    if [[ "$row" == "${NAME_PREFIX}-"*,* && -n "$n" && "$n" != *[!0-9]* ]] && (( 10#$n >= 1 && 10#$n <= COUNT )); then
+      CSV_VM_ROWS[10#$n]="$row"
+      continue
+    fi
+    CSV_OTHER_ROWS+="${row}"$'\n'
+  done <"$INSTANCES_CSV"
+fi
+
+# Rewrite instances.csv in one write: other VMs' rows, then this run's VMs in order
+write_instances_csv() {
+  local rows="$CSV_OTHER_ROWS" j
+  for ((j = 1; j <= COUNT; j++)); do
+    if [[ -n "${CSV_VM_ROWS[j]:-}" ]]; then
+      rows+="${CSV_VM_ROWS[j]}"$'\n'
+    fi
+  done
+  printf '%s' "$rows" >"$INSTANCES_CSV"
+}
+write_instances_csv
+
+for ((i = 1; i <= COUNT; i++)); do
+  vm_paths "$i"
+  IP="${IPS[i-1]}"
+
+  gen_mac "$i" MAC
   UNIQUE_UUID=$(uuidgen)
 
   # 4) Build QEMU command
@@ -271,7 +443,7 @@ EOF
     -drive if=virtio,file=${OVL},format=qcow2,cache=none,discard=unmap \
     -drive if=virtio,file=${SEED_ISO},format=raw,readonly=on \
     -netdev bridge,id=net0,br=${BRIDGE} \
-    -device virtio-net-pci,netdev=net0,mac=52:54:00:12:34:${MAC_SUFFIX} \
+    -device virtio-net-pci,netdev=net0,mac=${MAC} \
     -uuid ${UNIQUE_UUID} \
     -name ${NAME} \
     -nographic"
@@ -293,15 +465,18 @@ EOF
   esac
 
   echo "[+] Launched ${NAME} (IP ${IP}) in a new terminal"
-  SUMMARY+=("${NAME} ${IP}")
+  CSV_VM_ROWS[i]="${NAME},${IP},${MAC},${OVL},${SEED_ISO}"
+  write_instances_csv
+  SUMMARY+=("$NAME" "$IP")
 done
 
 echo
 echo "Summary"
 echo "-------"
-for line in "${SUMMARY[@]}"; do
-  printf "%-16s %s\n" "${line%% *}" "${line##* }"
-done
+if (( COUNT > 0 )); then
+  printf "%-16s %s\n" ${SUMMARY[@]+"${SUMMARY[@]}"}
+fi
+echo "(also written to ${INSTANCES_CSV})"
 
 echo
 echo "Tip: check each VM's cloud-init progress with:  sudo tail -f /var/log/cloud-init-output.log"